@@ -1,7 +1,12 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, g
 import pandas as pd
 import os
 import io
+import gzip
+import zipfile
+import threading
+import time
+from collections import deque
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from openpyxl import Workbook, load_workbook
@@ -11,20 +16,146 @@ from pathlib import Path
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['MAX_DECOMPRESSED_LENGTH'] = 500 * 1024 * 1024  # 500MB max size of a compressed upload once decompressed
+app.config['PARSE_MEMORY_BUDGET'] = 1024 * 1024 * 1024  # 1GB of estimated parse memory across all /compare requests
+app.config['ADMISSION_MAX_QUEUE'] = 8  # Requests allowed to wait for memory before new ones are rejected
+app.config['ADMISSION_QUEUE_TIMEOUT'] = 30  # Seconds a queued request waits before it is rejected
+app.config['ADMISSION_RETRY_AFTER'] = 15  # Retry-After seconds sent with rejections
 
 # Create uploads directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
+# Compressed uploads: maps the compression suffix to the formats allowed inside it
+COMPRESSED_EXTENSIONS = {
+    'gz': {'csv'},
+    'zst': {'csv'},
+    'zip': ALLOWED_EXTENSIONS,
+}
+
+
+def get_file_format(filename):
+    """Return (file_ext, compression) for a filename, e.g. ('csv', 'gz') for 'hosts.csv.gz'"""
+    parts = filename.lower().rsplit('.', 2)
+    if len(parts) < 2:
+        return None, None
+    
+    if parts[-1] in COMPRESSED_EXTENSIONS:
+        if parts[-1] == 'zip':
+            # The inner format is taken from the archive member, not the filename
+            return None, 'zip'
+        if len(parts) == 3:
+            return parts[-2], parts[-1]
+        return None, parts[-1]
+    
+    return parts[-1], None
 
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    if '.' not in filename:
+        return False
+    
+    file_ext, compression = get_file_format(filename)
+    if compression == 'zip':
+        return True
+    if compression:
+        return file_ext in COMPRESSED_EXTENSIONS[compression]
+    return file_ext in ALLOWED_EXTENSIONS
 
 
-def read_file_by_format(file, filename):
-    """Read file based on its format (CSV or XLSX)"""
-    file_ext = filename.rsplit('.', 1)[1].lower()
+class DecompressedSizeLimiter(io.RawIOBase):
+    """Wrap a decompressing stream and raise ValueError once more than `limit` bytes come out of it"""
+    
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return self._stream.seekable()
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._position = self._stream.seek(offset, whence)
+        return self._position
+    
+    def tell(self):
+        return self._position
+    
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        self._position += len(data)
+        if self._position > self._limit:
+            raise ValueError(f"Decompressed file exceeds the {self._limit / (1024 * 1024):.1f}MB limit")
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_zstd_stream(file):
+    """Return a streaming zstd decompressor over file"""
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("Reading .zst files requires the zstandard package")
+    return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True, closefd=False)
+
+
+def get_zip_member(archive):
+    """Return the ZipInfo of the single CSV/XLSX file inside a zip archive
+    
+    Directories and hidden entries (e.g. the __MACOSX/ metadata added by macOS Finder) are ignored.
+    """
+    members = [
+        m for m in archive.infolist()
+        if not m.is_dir()
+        and not m.filename.startswith('__MACOSX/')
+        and not any(part.startswith('.') for part in m.filename.split('/'))
+    ]
+    if len(members) != 1:
+        raise ValueError(f"Zip archive must contain exactly one file, found {len(members)}")
+    
+    member_name = members[0].filename
+    if not allowed_file(member_name) or get_file_format(member_name)[1]:
+        raise ValueError(f"Unsupported file inside zip archive: {member_name}")
+    return members[0]
+
+
+def read_file_by_format(file, filename, max_decompressed=None):
+    """Read file based on its format (CSV or XLSX, optionally gzip/zstd/zip compressed)
+    
+    Compressed uploads are decompressed as a stream straight into the parser,
+    the decompressed file is never written to disk. Decompression stops with a
+    ValueError past max_decompressed bytes (at most MAX_DECOMPRESSED_LENGTH).
+    """
+    file_ext, compression = get_file_format(filename)
+    if max_decompressed is None or max_decompressed > app.config['MAX_DECOMPRESSED_LENGTH']:
+        max_decompressed = app.config['MAX_DECOMPRESSED_LENGTH']
+    
+    if compression == 'zip':
+        # zipfile needs a seekable file, the uploaded (compressed) stream is one
+        with zipfile.ZipFile(file) as archive:
+            member_info = get_zip_member(archive)
+            member_name = member_info.filename
+            if member_info.file_size > max_decompressed:
+                raise ValueError(f"Decompressed file exceeds the {max_decompressed / (1024 * 1024):.1f}MB limit")
+            
+            # ZipExtFile stops at file_size and checks the CRC, so the header check above is the real limit
+            with archive.open(member_info) as member:
+                return read_file_by_format(member, member_name)
+    
+    if compression in ('gz', 'zst'):
+        if file_ext != 'csv':
+            raise ValueError(f"Unsupported compressed file format: {file_ext}.{compression}")
+        
+        if compression == 'gz':
+            decompressed = gzip.GzipFile(fileobj=file, mode='rb')
+        else:
+            decompressed = open_zstd_stream(file)
+        with decompressed:
+            limited = io.BufferedReader(DecompressedSizeLimiter(decompressed, max_decompressed))
+            return pd.read_csv(limited, compression=None)
     
     if file_ext == 'csv':
         return pd.read_csv(file)
@@ -34,6 +165,170 @@ def read_file_by_format(file, filename):
         raise ValueError(f"Unsupported file format: {file_ext}")
 
 
+# Rough in-memory size of a parsed DataFrame (after fillna) relative to the file size
+PARSE_MEMORY_MULTIPLIERS = {'csv': 10, 'xlsx': 50, 'xls': 20}
+# Fallback compression ratio (decompressed size / upload size) when the real size can't be read cheaply
+COMPRESSION_RATIOS = {'gz': 10, 'zst': 10}
+
+
+def get_upload_size(file):
+    """Return the size in bytes of an uploaded file without reading it"""
+    stream = file.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def get_decompressed_size(file, compression):
+    """Return the decompressed size recorded in a gzip/zstd upload, or None if it isn't available"""
+    stream = file.stream
+    position = stream.tell()
+    try:
+        if compression == 'gz':
+            # ISIZE trailer: uncompressed size of the last member modulo 2**32
+            stream.seek(-4, os.SEEK_END)
+            return int.from_bytes(stream.read(4), 'little')
+        
+        try:
+            import zstandard
+        except ImportError:
+            return None
+        # Frame content size from the first frame header (at most 18 bytes), -1 if the writer didn't record it
+        stream.seek(0)
+        try:
+            content_size = zstandard.frame_content_size(stream.read(18))
+        except zstandard.ZstdError:
+            return None
+        return content_size if content_size >= 0 else None
+    except (OSError, ValueError):
+        return None
+    finally:
+        stream.seek(position)
+
+
+def estimate_parse_memory(file, filename):
+    """Estimate peak memory needed to parse an uploaded file into a DataFrame
+    
+    Returns (estimated_bytes, file_size) where file_size is the (decompressed) size the
+    estimate relies on. Pass it to read_file_by_format() as max_decompressed so a file
+    that inflates past its reservation is rejected instead of parsed.
+    """
+    file_ext, compression = get_file_format(filename)
+    size = get_upload_size(file)
+    
+    if compression == 'zip':
+        # Only the central directory is read, nothing is decompressed
+        with zipfile.ZipFile(file.stream) as archive:
+            member_info = get_zip_member(archive)
+        file.stream.seek(0)
+        size = member_info.file_size
+        file_ext = get_file_format(member_info.filename)[0]
+    elif compression:
+        # The header only covers the first zstd frame / last gzip member and can be forged,
+        # so it may raise the estimate above the fixed ratio but never lower it
+        decompressed_size = get_decompressed_size(file, compression) or 0
+        size = max(decompressed_size, size * COMPRESSION_RATIOS[compression])
+    
+    if compression:
+        # Larger files are rejected while decompressing, before they are fully parsed
+        size = min(size, app.config['MAX_DECOMPRESSED_LENGTH'])
+    
+    return size * PARSE_MEMORY_MULTIPLIERS[file_ext], size
+
+
+class AdmissionController:
+    """Track estimated parse memory in flight and admit, queue or reject new work against a budget
+    
+    The budget, queue size and timeout are read from the app config on every use,
+    so PARSE_MEMORY_BUDGET, ADMISSION_MAX_QUEUE and ADMISSION_QUEUE_TIMEOUT can be changed at runtime.
+    """
+    
+    def __init__(self):
+        self.in_flight_bytes = 0
+        self.in_flight_requests = 0
+        self.peak_queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = deque()
+        self._condition = threading.Condition()
+    
+    def acquire(self, estimated_bytes):
+        """Reserve memory for a request, waiting in the queue if needed.
+        
+        Requests are admitted first in, first out: once anyone is waiting, new
+        requests join the back of the queue even if they would fit.
+        Returns the number of bytes reserved, or None if the request was rejected.
+        """
+        budget = app.config['PARSE_MEMORY_BUDGET']
+        # A single request larger than the whole budget can still run, but only on its own
+        estimated_bytes = min(estimated_bytes, budget)
+        
+        with self._condition:
+            if not self._waiters and self.in_flight_bytes + estimated_bytes <= budget:
+                return self._admit(estimated_bytes)
+            
+            if len(self._waiters) >= app.config['ADMISSION_MAX_QUEUE']:
+                self.rejected += 1
+                return None
+            
+            ticket = object()
+            self._waiters.append(ticket)
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._waiters))
+            deadline = time.monotonic() + app.config['ADMISSION_QUEUE_TIMEOUT']
+            try:
+                # Only the head of the queue may take memory
+                while self._waiters[0] is not ticket or self.in_flight_bytes + estimated_bytes > budget:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return None
+                    self._condition.wait(remaining)
+                return self._admit(estimated_bytes)
+            finally:
+                self._waiters.remove(ticket)
+                # The next request in line may now be at the head
+                self._condition.notify_all()
+    
+    def _admit(self, estimated_bytes):
+        self.in_flight_bytes += estimated_bytes
+        self.in_flight_requests += 1
+        self.admitted += 1
+        return estimated_bytes
+    
+    def release(self, reserved_bytes):
+        """Return memory reserved by acquire() and wake up queued requests"""
+        with self._condition:
+            self.in_flight_bytes -= reserved_bytes
+            self.in_flight_requests -= 1
+            self._condition.notify_all()
+    
+    def stats(self):
+        with self._condition:
+            return {
+                'budget_bytes': app.config['PARSE_MEMORY_BUDGET'],
+                'in_flight_bytes': self.in_flight_bytes,
+                'in_flight_requests': self.in_flight_requests,
+                'queue_depth': len(self._waiters),
+                'peak_queue_depth': self.peak_queue_depth,
+                'max_queue': app.config['ADMISSION_MAX_QUEUE'],
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
+
+
+admission = AdmissionController()
+
+
+@app.teardown_request
+def release_parse_memory(exc=None):
+    """Release the memory reserved by /compare once the request has finished, even on errors"""
+    reserved_bytes = g.pop('reserved_parse_bytes', None)
+    if reserved_bytes is not None:
+        admission.release(reserved_bytes)
+
+
 def get_column_name(df, column_str):
     """Get column name from dataframe by index, Excel letter, or column name"""
     # Try column name first
@@ -106,11 +401,32 @@ def compare_files():
             return jsonify({'error': 'Please select both files'}), 400
         
         if not (allowed_file(source_file.filename) and allowed_file(reference_file.filename)):
-            return jsonify({'error': 'Invalid file types. Please upload CSV or XLSX files'}), 400
+            return jsonify({'error': 'Invalid file types. Please upload CSV or XLSX files (.csv.gz, .csv.zst and .zip are also accepted)'}), 400
+        
+        # Admission control: parsing expands each file many times over in pandas
+        source_bytes, source_size = estimate_parse_memory(source_file, source_file.filename)
+        reference_bytes, reference_size = estimate_parse_memory(reference_file, reference_file.filename)
+        estimated_bytes = source_bytes + reference_bytes
+        endpoints_size = None
+        if endpoints_file and endpoints_file.filename != '' and allowed_file(endpoints_file.filename):
+            try:
+                endpoints_bytes, endpoints_size = estimate_parse_memory(endpoints_file, endpoints_file.filename)
+                estimated_bytes += endpoints_bytes
+            except Exception:
+                # The optional endpoints file is skipped below if it can't be read
+                pass
+        
+        reserved_bytes = admission.acquire(estimated_bytes)
+        if reserved_bytes is None:
+            app.logger.warning('Rejected /compare request needing ~%d MB of parse memory: %s',
+                               estimated_bytes // (1024 * 1024), admission.stats())
+            retry_after = app.config['ADMISSION_RETRY_AFTER']
+            return jsonify({'error': f'Server is busy processing other comparisons. Please retry in {retry_after} seconds'}), 503, {'Retry-After': str(retry_after)}
+        g.reserved_parse_bytes = reserved_bytes
         
-        # Read files based on their format
-        source_df = read_file_by_format(source_file, source_file.filename)
-        reference_df = read_file_by_format(reference_file, reference_file.filename)
+        # Read files based on their format, decompressing no more than was reserved for
+        source_df = read_file_by_format(source_file, source_file.filename, source_size)
+        reference_df = read_file_by_format(reference_file, reference_file.filename, reference_size)
         
         # Fill NaN
         source_df = source_df.fillna('')
@@ -189,7 +505,7 @@ def compare_files():
         endpoints_without_agent_count = len(unique_in_reference)
         if endpoints_file and endpoints_file.filename != '':
             try:
-                endpoints_df = read_file_by_format(endpoints_file, endpoints_file.filename)
+                endpoints_df = read_file_by_format(endpoints_file, endpoints_file.filename, endpoints_size)
                 endpoints_df = endpoints_df.fillna('')
                 # Try to get the column - default to first column
                 endpoints_col = get_column_name(endpoints_df, request.form.get('endpoints_column', '0'))
@@ -216,6 +532,12 @@ def compare_files():
         return jsonify({'error': f'Error during comparison: {str(e)}\n{traceback.format_exc()}'}), 500
 
 
+@app.route('/admission', methods=['GET'])
+def admission_stats():
+    """Expose in-flight parse memory, queue depth and rejection counts for capacity planning"""
+    return jsonify(admission.stats())
+
+
 @app.route('/download', methods=['POST'])
 def download_results():
     try: